@@ -3,76 +3,91 @@
 
 import logging
 import time
+from collections import deque
 from config import (
-    COMMAND_MAPPINGS, CONFIDENCE_THRESHOLDS, 
-    COMMAND_PRIORITY, COMMAND_RESTRICTIONS, COMMAND_COOLDOWNS
+    COMMAND_MAPPINGS, CONFIDENCE_THRESHOLDS, ACTIVE_MAPPING_COUNT,
+    COMMAND_PRIORITY, COMMAND_ALLOWED_MASK, COMMAND_COOLDOWNS, DroneState,
+    SAFETY_CONFIG
 )
 
 logger = logging.getLogger(__name__)
 
+_DEFAULT_COOLDOWN = COMMAND_COOLDOWNS["default"]
+_STATE_NAMES = tuple(state.name for state in DroneState)
+
 class CommandMapper:
     """Manages drone state and command restrictions"""
     
+    __slots__ = ("_state", "last_command_time", "last_command",
+                 "cooldown_until", "command_history")
+    
     def __init__(self):
-        self.drone_state = "grounded"  # grounded, taking_off, flying, landing
+        self._state = DroneState.grounded
         self.last_command_time = 0
         self.last_command = None
         self.cooldown_until = 0
-        self.command_history = []
+        self.command_history = deque(maxlen=SAFETY_CONFIG["history_max"])
+        
+    @property
+    def drone_state(self):
+        """Current state name: grounded, taking_off, flying or landing"""
+        return _STATE_NAMES[self._state]
         
     def update_drone_state(self, new_state):
-        """Update the drone's current state"""
-        old_state = self.drone_state
-        self.drone_state = new_state
-        logger.info(f"Drone state changed: {old_state} → {new_state}")
+        """Update the drone's current state (a DroneState or its name)"""
+        old_state = self._state
+        self._state = DroneState[new_state] if isinstance(new_state, str) else DroneState(new_state)
+        logger.info("Drone state changed: %s → %s", _STATE_NAMES[old_state], _STATE_NAMES[self._state])
         
     def is_command_allowed(self, command, current_time):
-        """Check if a command is allowed based on current state and cooldowns"""
+        """Check if a command is allowed based on current state and cooldowns.
+
+        current_time must come from time.monotonic().
+        """
         # RC commands are always allowed when flying
         if command == "rc":
-            return self.drone_state == "flying"
+            return self._state == DroneState.flying
         
         # Check cooldown for other commands
         if current_time < self.cooldown_until:
-            logger.debug(f"Command {command} blocked by cooldown "
-                        f"({self.cooldown_until - current_time:.1f}s remaining)")
+            logger.debug("Command %s blocked by cooldown (%.1fs remaining)",
+                         command, self.cooldown_until - current_time)
             return False
         
         # Check state restrictions
-        if self.drone_state in COMMAND_RESTRICTIONS:
-            restricted_commands = COMMAND_RESTRICTIONS[self.drone_state]
-            if command in restricted_commands:
-                logger.debug(f"Command {command} restricted in state {self.drone_state}")
-                return False
+        if not COMMAND_ALLOWED_MASK.get(command, ~0) >> self._state & 1:
+            logger.debug("Command %s restricted in state %s", command, _STATE_NAMES[self._state])
+            return False
                 
         return True
     
     def apply_cooldown(self, command, current_time):
-        """Apply cooldown period after a command"""
-        cooldown = COMMAND_COOLDOWNS.get(command, COMMAND_COOLDOWNS["default"])
+        """Apply cooldown period after a command (current_time from time.monotonic())"""
+        cooldown = COMMAND_COOLDOWNS.get(command, _DEFAULT_COOLDOWN)
         self.cooldown_until = current_time + cooldown
-        logger.debug(f"Applied {cooldown}s cooldown for command {command}")
+        logger.debug("Applied %ss cooldown for command %s", cooldown, command)
     
     def handle_command_completion(self, command, success):
         """Handle notification that a command has completed"""
         if command == "takeoff" and success:
-            self.update_drone_state("flying")
+            self.update_drone_state(DroneState.flying)
         elif command == "land" and success:
-            self.update_drone_state("grounded")
+            self.update_drone_state(DroneState.grounded)
         elif command in ["takeoff", "land"] and not success:
             # Failed takeoff/land, revert to previous state
-            if self.drone_state == "taking_off":
-                self.update_drone_state("grounded")
-            elif self.drone_state == "landing":
-                self.update_drone_state("flying")
+            if self._state == DroneState.taking_off:
+                self.update_drone_state(DroneState.grounded)
+            elif self._state == DroneState.landing:
+                self.update_drone_state(DroneState.flying)
     
     def get_state_info(self):
         """Get current mapper state information"""
-        current_time = time.time()
+        current_time = time.monotonic()
         return {
-            "drone_state": self.drone_state,
+            "drone_state": _STATE_NAMES[self._state],
             "last_command": self.last_command,
             "cooldown_active": current_time < self.cooldown_until,
             "cooldown_remaining": max(0, self.cooldown_until - current_time),
-            "command_count": len(self.command_history)
+            "command_count": len(self.command_history),
+            "active_mappings": ACTIVE_MAPPING_COUNT
         }
@@ -2,6 +2,8 @@
 # Simplified configuration with spike-based control
 
 import os
+from enum import IntEnum
+from typing import NamedTuple
 
 # Model paths - 4-class model
 MODELS = {
@@ -10,14 +12,16 @@ MODELS = {
         "scaler_path": r"C:\Users\silve\Tello-Python\neurosity_tello\optuna_hyperparameter_xgboost2\4_class_eeg_scaler_optuna_20250619_190434.pkl",
         "num_classes": 4,
         "class_names": ["Rest", "Left_Fist", "Right_Fist", "Both_Fists"],
-        "features": "covariance"
+        "features": "covariance",
+        "use_dmatrix": False  # Predict through a DMatrix instead of inplace_predict
     },
     "8_class": {
         "model_path": r"F:\neurosity_final\training_pipeline\kinesis_xgboost_model_softprob.json",
         "scaler_path": r"F:\neurosity_final\training_pipeline\kinesis_scaler.pkl",
         "num_classes": 8,
         "class_names": ["Unknown_Disappear34", "Left_Foot", "Left_Arm", "Push", "Tongue", "Disappear22", "Rest", "Jumping_Jacks"],
-        "features": "covariance"
+        "features": "covariance",
+        "use_dmatrix": False  # Predict through a DMatrix instead of inplace_predict
     }
 }
 
@@ -46,7 +50,10 @@ SPIKE_DETECTION = {
 TRIADIC_CONTROL = {
     "enabled": True,
     "update_rate_hz": 15,  # Command update frequency
-    "smoothing_factor": 0.7,  # For output smoothing
+    "smoothing_factor": 0.7,  # For output smoothing (α-β filter alpha = 1 - smoothing_factor)
+    "smoothing_beta": 0.0,  # α-β trend gain; 0 gives a plain EMA. Critical damping is
+                            # beta = 2 - alpha - 2*sqrt(1 - alpha) (~0.027 at alpha 0.3);
+                            # anything above overshoots, so the yaw swings past zero after a spike
     "dead_zone": 0.1,  # Minimum control signal to act on
     # MODIFICATION: Reduced max rotation speed for more manageable control.
     "max_rotation_speed": 45,  # Original: 90
@@ -67,12 +74,35 @@ COMMAND_MAPPINGS = {
     }
 }
 
+# Drone states; the integer value is the bit index used in COMMAND_ALLOWED_MASK
+class DroneState(IntEnum):
+    grounded = 0
+    taking_off = 1
+    flying = 2
+    landing = 3
+
+# toggle_flight resolution by drone state: state -> (command, transitional state).
+# States not listed (taking_off, landing) ignore the toggle.
+TOGGLE_FLIGHT_RESOLUTION = {
+    "grounded": ("takeoff", "taking_off"),
+    "flying": ("land", "landing"),
+}
+
 # Command restrictions by drone state
+# (frozensets so the per-tick `in` check is a hash probe, not a list scan)
 COMMAND_RESTRICTIONS = {
-    "grounded": ["rc", "forward", "back", "left", "right", "up", "down"],
-    "taking_off": ["rc", "takeoff", "land"],
-    "landing": ["rc", "takeoff", "land"],
-    "flying": []
+    "grounded": frozenset({"rc", "forward", "back", "left", "right", "up", "down"}),
+    "taking_off": frozenset({"rc", "takeoff", "land"}),
+    "landing": frozenset({"rc", "takeoff", "land"}),
+    "flying": frozenset()
+}
+
+# Per-command bitmask of states the command is allowed in (bit n = DroneState n).
+# Commands that are never restricted are absent and treated as allowed everywhere.
+COMMAND_ALLOWED_MASK = {
+    command: sum(1 << state for state in DroneState
+                 if command not in COMMAND_RESTRICTIONS.get(state.name, ()))
+    for restricted in COMMAND_RESTRICTIONS.values() for command in restricted
 }
 
 # Command cooldowns
@@ -89,6 +119,23 @@ COMMAND_PRIORITY = {
     "takeoff": 80,
 }
 
+class ActiveCommand(NamedTuple):
+    """Resolved view of an enabled COMMAND_MAPPINGS entry"""
+    drone_command: str
+    description: str
+    threshold: float
+
+# Enabled mappings only, resolved once at import: class -> ActiveCommand
+ACTIVE_COMMAND_TABLE = {
+    class_name: ActiveCommand(
+        mapping["drone_command"],
+        mapping["description"],
+        CONFIDENCE_THRESHOLDS.get(class_name, 0.7),
+    )
+    for class_name, mapping in COMMAND_MAPPINGS.items() if mapping.get("enabled")
+}
+ACTIVE_MAPPING_COUNT = len(ACTIVE_COMMAND_TABLE)
+
 # EEG Processing
 EEG_CONFIG = {
     "channels": 8,
@@ -96,7 +143,8 @@ EEG_CONFIG = {
     "buffer_length_secs": 8,
     "filter_low": 7.0,
     "filter_high": 30.0,
-    "update_rate": 2  # Hz - predictions per second
+    "update_rate": 2,  # Hz - predictions per second
+    "xgb_threads": None  # XGBoost threads per model; None = 1 per model, or up to 2 for a single model
 }
 
 # Feature Buffer
@@ -111,7 +159,8 @@ SAFETY_CONFIG = {
     "low_battery_threshold": 20,
     "command_timeout": 30,
     "enable_auto_land": True,
-    "data_timeout": 5.0  # Seconds without data before safety shutdown
+    "data_timeout": 5.0,  # Seconds without data before safety shutdown
+    "history_max": 1024  # Most recent commands kept in CommandMapper.command_history
 }
 
 # UDP Communication
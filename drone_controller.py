@@ -1,28 +1,50 @@
-#!/usr/bin/env python
-# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
 """
 drone_controller.py - Tello Drone Controller for RC Mode
 Handles discrete commands and a high-frequency stream of RC commands.
-NOTE: This script is for Python 2.7.
+NOTE: This script is for Python 3.11+.
 """
 
-from __future__ import print_function, division
 import socket
+import select
+import struct
 import json
 import time
 import logging
 import threading
 import sys
-import urllib2
+import signal
+import heapq
+import itertools
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
+from time import monotonic
 
 # Configuration
 UDP_IP, UDP_PORT, BUFFER_SIZE = "127.0.0.1", 9999, 1024
-BCI_BRIDGE_URL = "http://127.0.0.1:5001/update_drone_state"
+RECEIVE_TIMEOUT = 1.0  # Seconds without commands before a hover keepalive
+WAKEUP_ADDRESS = ("127.0.0.1", 0)  # Loopback socket poked on shutdown to wake the receiver
+MAX_BATCH = 64  # Datagrams drained per wakeup
+UDP_RCVBUF = 1 << 20  # Receive buffer so RC bursts are not dropped while a command executes
+CALLBACK_TEMPLATE = '{"command":"%s","success":%s}'  # Only filled with known command names
+CALLBACK_QUEUE_SIZE = 64  # Pending completion callbacks before new ones are dropped
+HOVER_RC = "rc 0 0 0 0"
+RC_HEARTBEAT = 0.1  # Seconds before an unchanged RC command is sent again
+RC_LOG_EVERY = 50  # Log one in this many RC commands (DEBUG only)
+RC_PACKET_CACHE_SIZE = 256  # Encoded RC datagrams kept before the cache is flushed
+# Binary RC datagrams from the bridge: tag byte, then roll, pitch, throttle, yaw (must match the bridge)
+RC_STRUCT, RC_TAG = struct.Struct("<B4b"), b"\x01"
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger(__name__)
 
+# Prefer a C JSON parser when one is installed
+try:
+    from ujson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 # Tello SDK import
 try:
     from tello import Tello
@@ -30,17 +52,48 @@ try:
 except ImportError:
     logger.warning("Tello module not found - running in simulation mode.")
     TELLO_AVAILABLE = False
-    class Tello(object):
+    class Tello:
         def send_command(self, cmd, wait_for_response=True):
             logger.info("[SIMULATED] Tello command: %s", cmd)
             return "ok"
 
-class DroneController(object):
+def start_log_listener():
+    """Move the root handlers behind a queue so log I/O happens on a listener thread."""
+    root = logging.getLogger()
+    listener = QueueListener(Queue(-1), *root.handlers)
+    root.handlers = [QueueHandler(listener.queue)]
+    listener.start()
+    return listener
+
+class DroneController:
     def __init__(self, test_mode=True):
         self.test_mode = test_mode
         self.tello, self.is_flying, self.running = None, False, True
-        self.udp_socket = None
-        self.last_rc_command_time = 0
+        self.stop_event = threading.Event()  # Set by stop() to end run()
+        self.udp_socket, self.wakeup_socket = None, None
+        self.last_rc, self.last_rc_command_time = None, 0
+        self.rc_count = 0
+        # Direct RC path: pre-encoded datagrams sent on the Tello socket
+        self.tello_socket, self.tello_address = None, None
+        self.rc_packets = {HOVER_RC: HOVER_RC.encode('utf-8')}
+        self.rc_params = {}  # Binary RC datagram -> params string
+        # Delayed completion callbacks: a deadline heap served by a single timer thread
+        self.pending_callbacks = []  # heap of (due, seq, command, success, reply address)
+        self.callback_seq = itertools.count()
+        self.callback_cond = threading.Condition()
+        # Sender of the discrete command being executed; its completion ack is sent back there
+        self.command_sender = None
+        # Discrete command dispatch
+        self.discrete_handlers = {
+            "takeoff": self.handle_takeoff,
+            "land": self.handle_land,
+            "emergency": self.handle_emergency,
+        }
+        # Encoded callback bodies for every known command and outcome
+        self.callback_bodies = {
+            (command, success): (CALLBACK_TEMPLATE % (command, "true" if success else "false")).encode('utf-8')
+            for command in self.discrete_handlers for success in (True, False)
+        }
 
     def initialize_drone(self):
         if not TELLO_AVAILABLE and not self.test_mode:
@@ -48,6 +101,12 @@ class DroneController(object):
             return False
         try:
             self.tello = Tello()
+            # The simulated Tello has no socket; RC then goes through send_command
+            self.tello_socket = getattr(self.tello, "socket", None)
+            self.tello_address = getattr(self.tello, "tello_address", None)
+            callback_thread = threading.Thread(target=self.callback_thread)
+            callback_thread.daemon = True
+            callback_thread.start()
             if not self.test_mode:
                 self.tello.send_command("command")
                 time.sleep(2)
@@ -60,82 +119,226 @@ class DroneController(object):
     def setup_udp_receiver(self):
         try:
             self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF)
             self.udp_socket.bind((UDP_IP, UDP_PORT))
-            self.udp_socket.settimeout(1.0)
+            self.udp_socket.setblocking(False)  # Readiness comes from select()
+            # A socket rather than a pipe: select() on Windows only accepts sockets
+            self.wakeup_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.wakeup_socket.bind(WAKEUP_ADDRESS)
             return True
         except Exception as e:
             logger.error("Failed to setup UDP listener: %s", e)
             return False
 
-    def send_completion_callback(self, command, success):
+    def send_completion_callback(self, command, success, address):
+        data = self.callback_bodies.get((command, success))
+        if data is None:
+            data = json.dumps({"command": command, "success": success}).encode('utf-8')
         try:
-            data = json.dumps({"command": command, "success": success})
-            req = urllib2.Request(BCI_BRIDGE_URL, data, {'Content-Type': 'application/json'})
-            urllib2.urlopen(req, timeout=2)
-        except Exception as e:
+            self.udp_socket.sendto(data, address)
+        except OSError as e:
             logger.error("Callback failed for %s: %s", command, e)
 
+    def schedule_completion_callback(self, delay, command, success):
+        """
+        Schedule a completion callback to the sender of the command being executed, sent
+        after `delay` seconds; never blocks.
+        """
+        if self.command_sender is None:
+            logger.error("Callback for %s dropped: command has no sender", command)
+            return
+        with self.callback_cond:
+            if len(self.pending_callbacks) >= CALLBACK_QUEUE_SIZE:
+                logger.error("Callback queue full, dropping callback for %s", command)
+                return
+            heapq.heappush(self.pending_callbacks,
+                           (monotonic() + delay, next(self.callback_seq), command, success,
+                            self.command_sender))
+            self.callback_cond.notify()
+
+    def cancel_callbacks(self):
+        """Drop every pending completion callback and wake the timer thread so it can exit."""
+        with self.callback_cond:
+            if self.pending_callbacks:
+                logger.info("Cancelling %d pending callback(s)", len(self.pending_callbacks))
+            self.pending_callbacks.clear()
+            self.callback_cond.notify()
+
+    def callback_thread(self):
+        """Timer thread that sends completion callbacks in deadline order until shutdown."""
+        while self.running:
+            with self.callback_cond:
+                if not self.pending_callbacks:
+                    self.callback_cond.wait(1.0)
+                    continue
+                delay = self.pending_callbacks[0][0] - monotonic()
+                if delay > 0:
+                    self.callback_cond.wait(delay)
+                    continue
+                _, _, command, success, address = heapq.heappop(self.pending_callbacks)
+            self.send_completion_callback(command, success, address)
+
+    def send_rc(self, params):
+        """Send an RC command as a cached, pre-encoded datagram (no response expected)."""
+        if self.tello_socket is None:
+            self.tello.send_command(params, wait_for_response=False)
+            return
+        packet = self.rc_packets.get(params)
+        if packet is None:
+            if len(self.rc_packets) >= RC_PACKET_CACHE_SIZE:
+                self.rc_packets.clear()
+            packet = self.rc_packets[params] = params.encode('utf-8')
+        self.tello_socket.sendto(packet, self.tello_address)
+
+    def execute_rc(self, params):
+        self.rc_count += 1
+        if not self.rc_count % RC_LOG_EVERY and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("RC command #%d: %s", self.rc_count, params)
+        if self.is_flying or self.test_mode:
+            # Repeats of the last RC command are only forwarded as a heartbeat
+            now = monotonic()
+            if params != self.last_rc or now - self.last_rc_command_time > RC_HEARTBEAT:
+                # Send RC command without waiting for a response for max throughput
+                self.send_rc(params)
+                self.last_rc, self.last_rc_command_time = params, now
+
     def execute_command(self, command_data):
         """Processes incoming commands from the BCI bridge."""
         command = command_data.get("command")
         
         # --- RC Command Handling ---
         if command == "rc":
-            if self.is_flying or self.test_mode:
-                params = command_data.get("params", "rc 0 0 0 0")
-                # Send RC command without waiting for a response for max throughput
-                self.tello.send_command(params, wait_for_response=False)
+            self.execute_rc(command_data.get("params", HOVER_RC))
             return
 
         # --- Discrete Command Handling ---
         logger.info("Executing discrete command: %s", command)
-        
-        if command == "takeoff" and not self.is_flying:
-            if "ok" in self.tello.send_command("takeoff"):
-                self.is_flying = True
-                threading.Timer(4.0, self.send_completion_callback, args=["takeoff", True]).start()
-        
-        elif command == "land" and self.is_flying:
-            if "ok" in self.tello.send_command("land"):
-                self.is_flying = False
-                threading.Timer(3.0, self.send_completion_callback, args=["land", True]).start()
+        handler = self.discrete_handlers.get(command)
+        if handler is not None:
+            handler()
+
+    def handle_takeoff(self):
+        if not self.is_flying and "ok" in self.tello.send_command("takeoff"):
+            self.is_flying = True
+            self.schedule_completion_callback(4.0, "takeoff", True)
 
-        elif command == "emergency":
-            self.tello.send_command("emergency")
+    def handle_land(self):
+        if self.is_flying and "ok" in self.tello.send_command("land"):
             self.is_flying = False
+            self.schedule_completion_callback(3.0, "land", True)
+
+    def handle_emergency(self):
+        self.tello.send_command("emergency")
+        self.is_flying = False
+
+    def drain_socket(self):
+        """Return the (datagram, sender) pairs already queued (up to MAX_BATCH), without blocking."""
+        packets = []
+        try:
+            while len(packets) < MAX_BATCH:
+                packets.append(self.udp_socket.recvfrom(BUFFER_SIZE))
+        except OSError:
+            pass  # Queue empty
+        return packets
+
+    def parse_packet(self, packet):
+        """
+        Return (command, payload) for a datagram: the params string for RC, else the decoded dict.
+        Binary RC packets are unpacked (and cached); everything else is decoded as JSON.
+        """
+        if packet[:1] == RC_TAG and len(packet) == RC_STRUCT.size:
+            params = self.rc_params.get(packet)
+            if params is None:
+                if len(self.rc_params) >= RC_PACKET_CACHE_SIZE:
+                    self.rc_params.clear()
+                params = self.rc_params[packet] = "rc %d %d %d %d" % RC_STRUCT.unpack(packet)[1:]
+            return "rc", params
+        command_data = json_loads(packet)
+        if not isinstance(command_data, dict):
+            raise ValueError("expected a JSON object, got %s" % type(command_data).__name__)
+        command = command_data.get("command")
+        if command == "rc":
+            return command, command_data.get("params", HOVER_RC)
+        return command, command_data
+
+    def execute_batch(self, packets):
+        """
+        Execute a batch in order; an RC command followed by another RC command is stale and skipped.
+        Each packet is handled on its own so a bad one cannot drop a later land/emergency.
+        """
+        batch = []
+        for packet, sender in packets:
+            try:
+                batch.append(self.parse_packet(packet) + (sender,))
+            except ValueError as e:
+                logger.error("Invalid command packet: %s", e)
+        last = len(batch) - 1
+        for i, (command, payload, sender) in enumerate(batch):
+            try:
+                if command != "rc":
+                    self.command_sender = sender
+                    self.execute_command(payload)
+                elif i == last or batch[i + 1][0] != "rc":
+                    self.execute_rc(payload)
+            except Exception as e:
+                logger.error("Error executing %s command: %s", command, e)
 
     def receive_commands_thread(self):
         """Main loop to listen for and execute commands."""
+        sockets = [self.udp_socket, self.wakeup_socket]
         while self.running:
             try:
-                data, _ = self.udp_socket.recvfrom(BUFFER_SIZE)
-                self.execute_command(json.loads(data.strip()))
-            except socket.timeout:
-                # If no commands are received for 1 second and we are flying, send a hover command
-                # to keep the connection alive and stable.
-                if self.is_flying:
-                    self.tello.send_command("rc 0 0 0 0", wait_for_response=False)
-                continue
+                # Only a flying drone needs the hover keepalive; on the ground, sleep until traffic
+                readable = select.select(sockets, [], [], RECEIVE_TIMEOUT if self.is_flying else None)[0]
+                if not readable:
+                    # If no commands are received for 1 second and we are flying, send a hover command
+                    # to keep the connection alive and stable.
+                    if self.is_flying:
+                        self.send_rc(HOVER_RC)
+                    continue
+                if self.udp_socket in readable:
+                    self.execute_batch(self.drain_socket())
             except Exception as e:
                 logger.error("Receiver error: %s", e)
 
+    def wake_receiver(self):
+        """Wake the receive loop so it notices self.running has been cleared."""
+        try:
+            self.wakeup_socket.sendto(b"x", self.wakeup_socket.getsockname())
+        except OSError:
+            pass
+
+    def stop(self, *_signal_args):
+        """Ask run() to shut down; also installed as the SIGINT/SIGTERM handler."""
+        self.running = False
+        self.stop_event.set()
+
     def run(self):
         if not self.initialize_drone() or not self.setup_udp_receiver(): return 1
+        log_listener = start_log_listener()
         threading.Thread(target=self.receive_commands_thread).start()
+        if threading.current_thread() is threading.main_thread():
+            # Ctrl+C / termination set the stop event instead of raising mid-wait
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
         print("Drone controller (RC Mode) ready.")
         try:
-            while self.running: time.sleep(1)
+            # Bounded waits: on Windows signal handlers only run between waits
+            while not self.stop_event.wait(1.0): pass
         except KeyboardInterrupt: pass
         finally:
             self.running = False
+            self.cancel_callbacks()
+            self.wake_receiver()
             if self.is_flying: self.tello.send_command("land")
             self.udp_socket.close()
             print("Shutdown complete.")
+            log_listener.stop()  # Flushes queued records
 
 def main():
     test_mode = '--live' not in sys.argv
     if not test_mode:
-        if raw_input("Run in LIVE mode? (yes/no): ").lower().strip() != "yes":
+        if input("Run in LIVE mode? (yes/no): ").lower().strip() != "yes":
             return 0
     DroneController(test_mode=test_mode).run()
 
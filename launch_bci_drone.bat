@@ -37,8 +37,8 @@ echo ------------------------------------------------------------
 
 REM Start drone controller in new window
 echo.
-echo 1. Starting Drone Controller (Python 2.7)...
-start "Drone Controller" cmd /k "conda activate tello_py27 && python C:\Users\silve\Tello-Python\neurosity_tello\neurosity_tello_sixth_draft\drone_controller.py %DRONE_MODE%"
+echo 1. Starting Drone Controller (Python 3)...
+start "Drone Controller" cmd /k "F:\huggingface_transformers_course\transformers_env\python.exe C:\Users\silve\Tello-Python\neurosity_tello\neurosity_tello_sixth_draft\drone_controller.py %DRONE_MODE%"
 
 REM Wait a bit
 timeout /t 3 /nobreak > nul
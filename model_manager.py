@@ -7,19 +7,33 @@ import xgboost as xgb
 import pickle
 import logging
 from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 import time
+from typing import NamedTuple
 from config import MODELS, EEG_CONFIG
 
 logger = logging.getLogger(__name__)
 
+class FrozenScaler(NamedTuple):
+    """StandardScaler parameters loaded from a .npz file (no sklearn object or pickle needed)"""
+    mean_: np.ndarray
+    scale_: np.ndarray
+
+    def transform(self, features):
+        return (features - self.mean_) / self.scale_
+
 class ModelManager:
     """Manages multiple XGBoost models for BCI prediction"""
     
     def __init__(self):
         self.models = {}
         self.scalers = {}
+        self.fused_scalers = {}  # model -> (inv_scale, offset, out buffer) for StandardScalers
         self.model_configs = MODELS
         self.inference_lock = Lock()
+        # XGBoost releases the GIL while predicting, so the models can run side by side
+        self.inference_pool = ThreadPoolExecutor(max_workers=len(self.model_configs),
+                                                 thread_name_prefix="inference")
         self.last_predictions = {}
         self.inference_times = {}
         
@@ -38,16 +52,16 @@ class ModelManager:
                     
                 model = xgb.Booster()
                 model.load_model(config["model_path"])
+                model.set_param({"nthread": self._xgb_threads()})
                 self.models[model_name] = model
                 
-                # Load scaler
-                if not os.path.exists(config["scaler_path"]):
+                # Load scaler, preferring the .npz export next to the pickle
+                scaler = self._load_scaler(config["scaler_path"])
+                if scaler is None:
                     logger.error(f"Scaler file not found: {config['scaler_path']}")
                     continue
-                    
-                with open(config["scaler_path"], 'rb') as f:
-                    scaler = pickle.load(f)
                 self.scalers[model_name] = scaler
+                self._fuse_scaler(model_name, scaler)
                 
                 logger.info(f"Successfully loaded {model_name} model and scaler")
                 success_count += 1
@@ -58,17 +72,75 @@ class ModelManager:
         logger.info(f"Loaded {success_count}/{len(self.model_configs)} models")
         return success_count > 0
     
+    def _xgb_threads(self):
+        """
+        Threads per booster. The models already predict side by side on the inference pool,
+        so extra XGBoost threads would only compete with the EEG, web and RC threads.
+        """
+        if EEG_CONFIG.get("xgb_threads"):
+            return EEG_CONFIG["xgb_threads"]
+        if len(self.model_configs) > 1:
+            return 1
+        return max(1, min(2, (os.cpu_count() or 1) // 2))
+
+    @staticmethod
+    def _load_scaler(scaler_path):
+        """
+        Load a scaler from its .npz export if that is at least as new as the pickle, else
+        unpickle it and (re)write the .npz so later startups skip pickle. A retrained pickle
+        is therefore never shadowed by a stale export. Returns None if neither file exists.
+        """
+        npz_path = os.path.splitext(scaler_path)[0] + ".npz"
+        pkl_exists = os.path.exists(scaler_path)
+        if os.path.exists(npz_path) and \
+           (not pkl_exists or os.path.getmtime(npz_path) >= os.path.getmtime(scaler_path)):
+            with np.load(npz_path) as arrays:
+                return FrozenScaler(arrays["mean"], arrays["scale"])
+        if not pkl_exists:
+            return None
+        with open(scaler_path, 'rb') as f:
+            scaler = pickle.load(f)
+        # FrozenScaler always centres and scales, so only export scalers that do both
+        if getattr(scaler, "with_mean", True) and getattr(scaler, "with_std", True) and \
+           getattr(scaler, "mean_", None) is not None and getattr(scaler, "scale_", None) is not None:
+            try:
+                np.savez(npz_path, mean=scaler.mean_, scale=scaler.scale_)
+                logger.info(f"Exported scaler parameters to {npz_path}")
+            except OSError as e:
+                logger.warning(f"Could not export scaler to {npz_path}: {e}")
+        return scaler
+
+    def _fuse_scaler(self, model_name, scaler):
+        """
+        Precompute x * (1 / scale_) + (-mean_ / scale_) as float32 arrays for a StandardScaler,
+        so scaling is two in-place ufuncs into a reused buffer instead of sklearn's transform.
+        Honours with_mean / with_std: a fitted scaler still stores mean_ when with_mean=False
+        but transform() does not subtract it.
+        """
+        if not (hasattr(scaler, "mean_") and hasattr(scaler, "scale_")):
+            return  # Not a fitted StandardScaler; keep using transform()
+        mean = scaler.mean_ if getattr(scaler, "with_mean", True) else None
+        scale = scaler.scale_ if getattr(scaler, "with_std", True) else None
+        if mean is None and scale is None:
+            return  # Nothing to apply (or unknown layout); keep using transform()
+        n_features = (mean if mean is not None else scale).shape[0]
+        mean = mean if mean is not None else np.zeros(n_features)
+        scale = scale if scale is not None else np.ones(n_features)
+        inv_scale = (1.0 / scale).astype(np.float32)
+        offset = (-mean / scale).astype(np.float32)
+        self.fused_scalers[model_name] = (inv_scale, offset, np.empty((1, scale.shape[0]), dtype=np.float32))
+
     def prepare_features(self, cov_matrix, model_name):
         """Prepare features based on model requirements"""
         config = self.model_configs[model_name]
         
         if config["features"] == "covariance":
-            # Use covariance matrix features (current approach)
-            features = cov_matrix.flatten().reshape(1, -1)
+            # Use covariance matrix features (current approach); a view when already contiguous
+            features = np.ascontiguousarray(cov_matrix).reshape(1, -1)
         elif config["features"] == "raw":
             # For models that might use raw features
             # This is a placeholder - adjust based on actual 8-class model needs
-            features = cov_matrix.flatten().reshape(1, -1)
+            features = np.ascontiguousarray(cov_matrix).reshape(1, -1)
         else:
             raise ValueError(f"Unknown feature type: {config['features']}")
             
@@ -85,28 +157,38 @@ class ModelManager:
                 
         return features
     
-    def predict_single(self, model_name, cov_matrix):
-        """Run prediction for a single model"""
+    def predict_single(self, model_name, cov_matrix, features=None):
+        """Run prediction for a single model (features: already prepared by predict_dual)"""
         if model_name not in self.models:
             logger.error(f"Model {model_name} not loaded")
             return None
             
         try:
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             # Prepare features
-            features = self.prepare_features(cov_matrix, model_name)
+            if features is None:
+                features = self.prepare_features(cov_matrix, model_name)
             
             # Scale features
-            if model_name in self.scalers:
+            fused = self.fused_scalers.get(model_name)
+            if fused is not None:
+                inv_scale, offset, features_scaled = fused
+                np.multiply(features, inv_scale, out=features_scaled)
+                np.add(features_scaled, offset, out=features_scaled)
+            elif model_name in self.scalers:
                 features_scaled = self.scalers[model_name].transform(features)
             else:
                 features_scaled = features
                 logger.warning(f"No scaler found for {model_name}, using raw features")
             
-            # Make prediction
-            dmatrix = xgb.DMatrix(features_scaled)
-            probabilities = self.models[model_name].predict(dmatrix)
+            # Make prediction (inplace_predict skips building a DMatrix for the single row)
+            config = self.model_configs[model_name]
+            if config.get("use_dmatrix", False):
+                probabilities = self.models[model_name].predict(xgb.DMatrix(features_scaled))
+            else:
+                features_scaled = np.ascontiguousarray(features_scaled, dtype=np.float32)
+                probabilities = self.models[model_name].inplace_predict(features_scaled)
             
             # Handle different output shapes
             if probabilities.ndim == 1:
@@ -118,10 +200,11 @@ class ModelManager:
                 return None
             
             # Get prediction details
-            config = self.model_configs[model_name]
-            predicted_idx = int(np.argmax(probs))
+            # tolist() converts every probability to a Python float in one C-level pass
+            prob_list = probs.tolist()
+            predicted_idx = int(probs.argmax())
             predicted_class = config["class_names"][predicted_idx]
-            confidence = float(probs[predicted_idx])
+            confidence = prob_list[predicted_idx]
             
             # Create prediction result
             result = {
@@ -129,11 +212,8 @@ class ModelManager:
                 "predicted_class": predicted_class,
                 "predicted_idx": predicted_idx,
                 "confidence": confidence,
-                "probabilities": {
-                    config["class_names"][i]: float(probs[i])
-                    for i in range(len(config["class_names"]))
-                },
-                "inference_time": time.time() - start_time
+                "probabilities": dict(zip(config["class_names"], prob_list)),
+                "inference_time": time.perf_counter() - start_time
             }
             
             # Store for debugging
@@ -150,16 +230,35 @@ class ModelManager:
         with self.inference_lock:
             results = {}
             
-            # Run predictions for each loaded model
+            # Start predictions for each loaded model, preparing each feature type only once
+            features_by_type = {}
+            pending = {}
             for model_name in self.models.keys():
-                prediction = self.predict_single(model_name, cov_matrix)
+                feature_type = self.model_configs[model_name]["features"]
+                features = features_by_type.get(feature_type)
+                if features is None:
+                    try:
+                        features = features_by_type[feature_type] = self.prepare_features(cov_matrix, model_name)
+                    except Exception as e:
+                        logger.error(f"Prediction error for {model_name}: {str(e)}")
+                        continue
+                pending[model_name] = self.inference_pool.submit(
+                    self.predict_single, model_name, cov_matrix, features)
+            
+            # Collect them in model order
+            total_inference_time = 0.0
+            for model_name, future in pending.items():
+                prediction = future.result()
                 if prediction:
                     results[model_name] = prediction
-                    self.last_predictions[model_name] = prediction
+                    total_inference_time += prediction["inference_time"]
+            
+            # Publish a new snapshot in one rebind so readers never see a half-updated pair
+            self.last_predictions = {**self.last_predictions, **results}
             
             # Add metadata
-            results["timestamp"] = int(time.time() * 1000)
-            results["total_inference_time"] = sum(self.inference_times.values())
+            results["timestamp"] = time.time_ns() // 1_000_000
+            results["total_inference_time"] = total_inference_time
             
             return results
     
@@ -7,6 +7,7 @@ import sys
 import time
 import numpy as np
 import socket
+import struct
 import json
 from dotenv import load_dotenv
 from neurosity import NeurositySDK
@@ -20,7 +21,7 @@ from datetime import datetime
 # Import modules
 from config import (
     EEG_CONFIG, UDP_CONFIG, WEB_CONFIG, LOGGING_CONFIG, 
-    PUSH_COMMAND_COOLDOWN, CONFIDENCE_THRESHOLDS, 
+    PUSH_COMMAND_COOLDOWN, ACTIVE_COMMAND_TABLE, TOGGLE_FLIGHT_RESOLUTION,
     TRIADIC_CONTROL, SPIKE_DETECTION, SAFETY_CONFIG
 )
 from model_manager import ModelManager
@@ -30,6 +31,9 @@ from filterer import Filterer
 
 # Configuration
 ENV_PATH = r"X:\clean_copy\.env"
+# Binary RC datagram: tag byte, then roll, pitch, throttle, yaw in [-100, 100].
+# Must match RC_STRUCT/RC_TAG in drone_controller.py; JSON datagrams always start with "{".
+RC_STRUCT, RC_TAG = struct.Struct("<B4b"), 1
 
 # Logging Setup
 logging.basicConfig(level=getattr(logging, LOGGING_CONFIG["level"]), format=LOGGING_CONFIG["format"])
@@ -43,10 +47,16 @@ socketio = SocketIO(app, async_mode='threading', cors_allowed_origins="*")
 # --- Global Variables ---
 neurosity, model_manager, command_mapper, triadic_controller, filterer = None, None, None, None, None
 raw_unsubscribe = None
+padded_chunk = None  # Reused (channels + 2) x samples input for filterer.partial_transform
 data_processing_lock = Lock()
 cov_counter, data_received_count, last_data_time, last_push_command_time, state_change_lockout_time = 0, 0, 0, 0, 0
 push_command_in_progress, push_was_released, manual_override_active = False, True, False
 udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+# Resolved once so acks can be matched against recvfrom's numeric sender address
+drone_address = (socket.gethostbyname(UDP_CONFIG["drone_ip"]), UDP_CONFIG["drone_port"])
+# Bind now (ephemeral port) so drone acks can be received before the first send; stay on
+# loopback when the drone controller is local so other hosts cannot reach the socket
+udp_socket.bind(("127.0.0.1" if drone_address[0].startswith("127.") else "", 0))
 shutdown_flag = Event()
 
 
@@ -93,22 +103,36 @@ def send_drone_command(command_data):
     """Send command to drone via UDP."""
     try:
         message = json.dumps(command_data).encode('utf-8')
-        udp_socket.sendto(message, (UDP_CONFIG["drone_ip"], UDP_CONFIG["drone_port"]))
+        udp_socket.sendto(message, drone_address)
         return True
     except Exception as e:
         logger.error(f"Failed to send command: {e}")
         return False
 
+def send_rc_command(roll, pitch, throttle, yaw):
+    """Send an RC command to the drone as a packed binary datagram."""
+    try:
+        udp_socket.sendto(RC_STRUCT.pack(RC_TAG, roll, pitch, throttle, yaw), drone_address)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send RC command: {e}")
+        return False
+
 def process_eeg_data(brainwave_data):
     """Main callback from Neurosity to process EEG data."""
-    global cov_counter, last_data_time, data_received_count, push_was_released, push_command_in_progress, last_push_command_time
+    global cov_counter, last_data_time, data_received_count, push_was_released, push_command_in_progress, last_push_command_time, padded_chunk
     with data_processing_lock:
         last_data_time, data_received_count = time.time(), data_received_count + 1
         raw_data = np.array([ch_data for ch_data in brainwave_data.get('data', []) if ch_data])
         if raw_data.ndim != 2 or raw_data.shape[1] == 0: return
 
-        # EEG data processing pipeline
-        filterer.partial_transform(np.vstack((raw_data, np.zeros((2, raw_data.shape[1])))))
+        # EEG data processing pipeline; the filterer copies its input, so the padded
+        # buffer (two zero rows below the channels) is reused while the chunk shape holds
+        padded_shape = (raw_data.shape[0] + 2, raw_data.shape[1])
+        if padded_chunk is None or padded_chunk.shape != padded_shape:
+            padded_chunk = np.zeros(padded_shape)
+        padded_chunk[:-2] = raw_data
+        filterer.partial_transform(padded_chunk)
         cov_counter += raw_data.shape[1]
         
         # Check if enough samples have been collected to form a new prediction
@@ -123,17 +147,19 @@ def process_eeg_data(brainwave_data):
 
         # Handle Push command for takeoff/land
         push_pred = dual_predictions.get('8_class')
-        if push_pred:
+        push_entry = ACTIVE_COMMAND_TABLE.get('Push')
+        if push_pred and push_entry:
+            push_threshold = push_entry.threshold
             push_prob = push_pred.get('probabilities', {}).get('Push', 0.0)
-            if push_prob < CONFIDENCE_THRESHOLDS['Push'] * 0.7: push_was_released = True
+            if push_prob < push_threshold * 0.7: push_was_released = True
             
-            drone_state = command_mapper.get_state_info()['drone_state']
-            if push_pred['predicted_class'] == 'Push' and push_prob >= CONFIDENCE_THRESHOLDS['Push'] and \
-               push_was_released and not push_command_in_progress and drone_state in ['grounded', 'flying']:
-                cmd = 'takeoff' if drone_state == 'grounded' else 'land'
+            toggle = TOGGLE_FLIGHT_RESOLUTION.get(command_mapper.drone_state)
+            if push_pred['predicted_class'] == 'Push' and push_prob >= push_threshold and \
+               push_was_released and not push_command_in_progress and toggle:
+                cmd, pending_state = toggle
                 if send_drone_command({"command": cmd}):
                     push_command_in_progress, push_was_released = True, False
-                    command_mapper.update_drone_state('taking_off' if cmd == 'takeoff' else 'landing')
+                    command_mapper.update_drone_state(pending_state)
 
         # Update triadic controller with rotation data
         if dual_predictions.get('4_class') and triadic_controller:
@@ -143,17 +169,55 @@ def continuous_command_thread():
     """High-frequency thread to send RC commands for smooth control."""
     logger.info(f"RC command thread started ({TRIADIC_CONTROL['update_rate_hz']} Hz).")
     update_interval = 1.0 / TRIADIC_CONTROL["update_rate_hz"]
+    next_tick = time.perf_counter()
     while not shutdown_flag.is_set():
-        start_time = time.time()
-        drone_state = command_mapper.get_state_info()['drone_state']
+        drone_state = command_mapper.drone_state
         
         # Only send RC commands when flying or in manual override mode
         if (drone_state == 'flying' or manual_override_active) and triadic_controller:
-            rc_command = triadic_controller.get_rc_command()
-            send_drone_command({"command": "rc", "params": rc_command})
+            send_rc_command(*triadic_controller.get_rc_axes())
         
-        # Sleep to maintain the update rate
-        time.sleep(max(0, update_interval - (time.time() - start_time)))
+        # Sleep until the next fixed deadline so the rate does not drift; if a tick overran
+        # by more than a whole interval, restart the schedule rather than send a burst
+        next_tick += update_interval
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            shutdown_flag.wait(delay)
+        elif delay < -update_interval:
+            next_tick = time.perf_counter()
+
+def handle_drone_completion(command, success):
+    """Apply a takeoff/land completion reported by the drone controller."""
+    global push_command_in_progress
+    if command and isinstance(command, str):
+        command = sys.intern(command)  # JSON-decoded; intern to match config keys by identity
+        if command in ['takeoff', 'land']: push_command_in_progress = False
+        if command == 'takeoff' and success and triadic_controller:
+            logger.info("Takeoff successful, resetting triadic controller for stable hover.")
+            # update_prediction runs under this lock; its running sums must stay in step with the buffers
+            with data_processing_lock:
+                triadic_controller.reset()
+        command_mapper.handle_command_completion(command, success)
+
+def drone_ack_thread():
+    """Receive completion acks the drone controller sends back over the command socket."""
+    while not shutdown_flag.is_set():
+        try:
+            data, sender = udp_socket.recvfrom(1024)
+            if sender != drone_address:
+                logger.warning(f"Ignoring drone ack from unexpected sender {sender}")
+                continue
+            ack = json.loads(data)
+            if not isinstance(ack, dict):
+                raise ValueError(f"expected a JSON object, got {type(ack).__name__}")
+            command, success = ack.get('command'), ack.get('success', True)
+        except ValueError as e:
+            logger.error(f"Invalid drone ack: {e}")
+            continue
+        except OSError:
+            # Windows reports an earlier unreachable send as an error here; closed on shutdown
+            continue
+        handle_drone_completion(command, success)
 
 def neurosity_stream_runner():
     """Background thread for Neurosity data streaming."""
@@ -174,15 +238,8 @@ def index(): return render_template('drone_control_dashboard.html')
 
 @app.route('/update_drone_state', methods=['POST'])
 def update_drone_state_route():
-    global push_command_in_progress
     data = request.json
-    command, success = data.get('command'), data.get('success', True)
-    if command:
-        if command in ['takeoff', 'land']: push_command_in_progress = False
-        if command == 'takeoff' and success and triadic_controller:
-            logger.info("Takeoff successful, resetting triadic controller for stable hover.")
-            triadic_controller.reset()
-        command_mapper.handle_command_completion(command, success)
+    handle_drone_completion(data.get('command'), data.get('success', True))
     return jsonify({"success": True})
 
 # --- Main Execution ---
@@ -192,6 +249,7 @@ if __name__ == "__main__":
     
     Thread(target=neurosity_stream_runner, daemon=True).start()
     Thread(target=continuous_command_thread, daemon=True).start()
+    Thread(target=drone_ack_thread, daemon=True).start()
 
     logger.info("System Ready for RC Mode.")
     try:
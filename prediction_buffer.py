@@ -178,7 +178,7 @@ class PredictionBuffer:
     def _reset_tracker(self, class_name):
         """Reset sustained tracker for a class"""
         if class_name in self.sustained_trackers:
-            logger.debug(f"Reset sustained tracker for {class_name}")
+            logger.debug("Reset sustained tracker for %s", class_name)
             self.sustained_trackers[class_name] = {
                 "start_time": None,
                 "last_seen": None,
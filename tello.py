@@ -1,7 +1,6 @@
-#!/usr/bin/env python
-# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
 """
-tello.py - Minimal Tello drone control module for Python 2.7
+tello.py - Minimal Tello drone control module for Python 3
 Based on official DJI Tello SDK
 """
 
@@ -12,7 +11,7 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-class Tello(object):
+class Tello:
     """
     Minimal Tello interface for sending commands
     """
@@ -47,7 +46,7 @@ class Tello(object):
                 self.response = response.decode('utf-8')
                 self.response_received = True
                 logger.info("Received response: %s", self.response)
-            except socket.error as exc:
+            except OSError as exc:
                 logger.error("Socket error: %s", exc)
             except Exception as e:
                 logger.error("Error receiving response: %s", e)
@@ -2,36 +2,60 @@
 # Implements spike-based triadic control for smooth drone movement.
 # This version is optimized to generate stable, continuous RC commands.
 
-import numpy as np
+import math
 import time
 import logging
 from collections import deque
-from dataclasses import dataclass
-from typing import Dict, Optional, Tuple
+from typing import Dict, NamedTuple, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-@dataclass
-class SpikeEvent:
-    """Represents a detected spike in probability"""
+# Classes whose probabilities are buffered, and the subset that can produce spikes
+TRACKED_CLASSES = ("Left_Fist", "Right_Fist", "Both_Fists", "Rest")
+SPIKE_CLASSES = ("Left_Fist", "Right_Fist", "Both_Fists")
+
+# Spike detection constants
+MIN_SPIKE_SAMPLES = 10  # Buffered samples needed before detecting spikes
+MIN_SPIKE_STD = 0.01  # Ignore windows flatter than this
+SPIKE_MAX_AGE = 2.0  # Seconds a spike can stay active
+SPIKE_MIN_WEIGHT = 0.01  # Decayed magnitude below which a spike expires
+
+class SpikeEvent(NamedTuple):
+    """Represents a detected spike in probability (a tuple: cheap to create and read)"""
     timestamp: float
     magnitude: float
     class_name: str
+    expires_at: float  # When the decayed magnitude drops below SPIKE_MIN_WEIGHT
     
 class TriadicController:
     """
     Manages spike-based conversion of BCI predictions into smooth RC control signals.
     """
     
+    __slots__ = (
+        "enabled", "update_rate_hz", "smoothing_factor", "smoothing_beta", "_alpha", "dead_zone",
+        "max_rotation_speed", "max_forward_speed", "scale_exponent",
+        "_inv_live_range", "_scale",
+        "spike_enabled", "buffer_size", "spike_threshold_std", "min_spike_magnitude",
+        "spike_decay_rate", "_inv_log_decay", "spike_cooldown",
+        "prob_buffers", "prob_sums", "prob_sq_sums", "active_spikes", "last_spike_time",
+        "smoothed_rotation_velocity", "smoothed_forward_velocity", "rotation_trend", "forward_trend",
+        "rc_pitch", "rc_yaw", "last_update_time",
+    )
+    
     def __init__(self, triadic_config: dict, spike_config: dict):
         # Control parameters from config.py
         self.enabled = triadic_config.get("enabled", True)
         self.update_rate_hz = triadic_config.get("update_rate_hz", 15)
         self.smoothing_factor = triadic_config.get("smoothing_factor", 0.7)
+        self.smoothing_beta = triadic_config.get("smoothing_beta", 0.0)
+        self._alpha = 1.0 - self.smoothing_factor
         self.dead_zone = triadic_config.get("dead_zone", 0.1)
         self.max_rotation_speed = triadic_config.get("max_rotation_speed", 45)
         self.max_forward_speed = triadic_config.get("max_forward_speed", 50)
         self.scale_exponent = triadic_config.get("scale_exponent", 1.3)
+        self._inv_live_range = 1.0 / (1.0 - self.dead_zone)
+        self._scale = self._make_scale_fn(self.scale_exponent)
         
         # Spike detection parameters from config.py
         self.spike_enabled = spike_config.get("enabled", True)
@@ -39,19 +63,26 @@ class TriadicController:
         self.spike_threshold_std = spike_config.get("spike_threshold_std", 1.5)
         self.min_spike_magnitude = spike_config.get("min_spike_magnitude", 0.1)
         self.spike_decay_rate = spike_config.get("spike_decay_rate", 0.95)
+        self._inv_log_decay = 1.0 / math.log(self.spike_decay_rate) if self.spike_decay_rate < 1.0 else None
         self.spike_cooldown = spike_config.get("spike_cooldown", 0.5)
         
         # Probability buffers for each class
-        self.prob_buffers = { c: deque(maxlen=self.buffer_size) for c in ["Left_Fist", "Right_Fist", "Both_Fists", "Rest"] }
+        self.prob_buffers = { c: deque(maxlen=self.buffer_size) for c in TRACKED_CLASSES }
+        # Running sum / sum of squares per buffer for O(1) mean and std
+        self.prob_sums = { c: 0.0 for c in self.prob_buffers }
+        self.prob_sq_sums = { c: 0.0 for c in self.prob_buffers }
         
         # Spike tracking
-        self.active_spikes = { c: [] for c in ["Left_Fist", "Right_Fist", "Both_Fists"] }
-        self.last_spike_time = { c: 0 for c in ["Left_Fist", "Right_Fist", "Both_Fists"] }
+        self.active_spikes = { c: [] for c in SPIKE_CLASSES }
+        self.last_spike_time = { c: 0 for c in SPIKE_CLASSES }
         
         # Control state
         self.smoothed_rotation_velocity = 0.0
         self.smoothed_forward_velocity = 0.0
-        self.last_update_time = time.time()
+        self.rotation_trend = 0.0  # α-β filter trend (change per prediction)
+        self.forward_trend = 0.0
+        self.rc_pitch, self.rc_yaw = 0, 0  # RC axes derived from the smoothed velocities
+        self.last_update_time = time.monotonic()
         
         logger.info("TriadicController (RC Mode) initialized")
         logger.info(f"  Spike detection: {'ENABLED' if self.spike_enabled else 'DISABLED'}")
@@ -60,15 +91,23 @@ class TriadicController:
         """Process new prediction, detect spikes, and update control signals."""
         if not self.enabled: return
             
-        current_time = time.time()
-        probs = prediction_4class.get("probabilities", {})
+        current_time = time.monotonic()
+        probs_get = prediction_4class.get("probabilities", {}).get
+        sums, sq_sums, buffer_size = self.prob_sums, self.prob_sq_sums, self.buffer_size
         
-        # Update probability buffers
+        # Update probability buffers and their running sums
         for class_name, buffer in self.prob_buffers.items():
-            buffer.append(probs.get(class_name, 0.0))
+            prob = probs_get(class_name, 0.0)
+            if len(buffer) == buffer_size:
+                oldest = buffer[0]
+                sums[class_name] -= oldest
+                sq_sums[class_name] -= oldest * oldest
+            buffer.append(prob)
+            sums[class_name] += prob
+            sq_sums[class_name] += prob * prob
         
         # Detect spikes if enabled
-        if self.spike_enabled and len(self.prob_buffers["Left_Fist"]) >= 10:
+        if self.spike_enabled and len(self.prob_buffers["Left_Fist"]) >= MIN_SPIKE_SAMPLES:
             self._detect_spikes(current_time)
         
         # Update control signals based on spikes and current probabilities
@@ -76,31 +115,42 @@ class TriadicController:
     
     def _detect_spikes(self, current_time: float):
         """Detect probability spikes using rolling statistics."""
-        for class_name, buffer in self.prob_buffers.items():
-            if class_name == "Rest" or len(buffer) < 10: continue
+        for class_name in SPIKE_CLASSES:
+            buffer = self.prob_buffers[class_name]
+            if len(buffer) < MIN_SPIKE_SAMPLES: continue
 
-            buffer_array = np.array(buffer)
-            mean, std = np.mean(buffer_array), np.std(buffer_array)
+            n = len(buffer)
+            mean = self.prob_sums[class_name] / n
+            var = self.prob_sq_sums[class_name] / n - mean * mean
+            std = math.sqrt(var) if var > 0.0 else 0.0
             current_prob = buffer[-1]
 
-            if std > 0.01 and (current_prob - mean) / std > self.spike_threshold_std and \
+            if std > MIN_SPIKE_STD and current_prob - mean > self.spike_threshold_std * std and \
                current_prob > self.min_spike_magnitude and \
                (current_time - self.last_spike_time[class_name]) > self.spike_cooldown:
                 
-                spike = SpikeEvent(current_time, current_prob - mean, class_name)
+                magnitude = current_prob - mean
+                spike = SpikeEvent(current_time, magnitude, class_name,
+                                   current_time + self._spike_lifetime(magnitude))
                 self.active_spikes[class_name].append(spike)
                 self.last_spike_time[class_name] = current_time
         
         self._decay_spikes(current_time)
 
+    def _spike_lifetime(self, magnitude: float) -> float:
+        """
+        Seconds until magnitude * decay_rate ** age falls to SPIKE_MIN_WEIGHT, capped at
+        SPIKE_MAX_AGE. Solved once per spike so expiry is a single compare per tick.
+        """
+        if magnitude <= SPIKE_MIN_WEIGHT: return 0.0
+        if self._inv_log_decay is None: return SPIKE_MAX_AGE
+        return min(SPIKE_MAX_AGE, math.log(SPIKE_MIN_WEIGHT / magnitude) * self._inv_log_decay)
+
     def _decay_spikes(self, current_time: float):
-        """Apply decay to active spikes and remove expired ones."""
+        """Remove spikes that have decayed or aged out."""
         for class_name, spikes in self.active_spikes.items():
-            # List comprehension to filter out old spikes and decay current ones
-            self.active_spikes[class_name] = [
-                s for s in spikes 
-                if (current_time - s.timestamp) < 2.0 and s.magnitude * (self.spike_decay_rate ** (current_time - s.timestamp)) > 0.01
-            ]
+            if spikes:
+                self.active_spikes[class_name] = [s for s in spikes if s.expires_at > current_time]
 
     def _update_control_signals(self):
         """Convert active spikes into smoothed control signals."""
@@ -117,20 +167,48 @@ class TriadicController:
         rotation_scaled = self._apply_dead_zone_and_scaling(rotation_intent)
         forward_scaled = self._apply_dead_zone_and_scaling(forward_intent)
         
-        # Apply smoothing (Exponential Moving Average)
-        self.smoothed_rotation_velocity = self._smooth(self.smoothed_rotation_velocity, rotation_scaled)
-        self.smoothed_forward_velocity = self._smooth(self.smoothed_forward_velocity, forward_scaled)
+        # Apply smoothing (α-β filter)
+        self.smoothed_rotation_velocity, self.rotation_trend = self._smooth(
+            self.smoothed_rotation_velocity, self.rotation_trend, rotation_scaled)
+        self.smoothed_forward_velocity, self.forward_trend = self._smooth(
+            self.smoothed_forward_velocity, self.forward_trend, forward_scaled)
+        self._update_rc_axes()
+    
+    def _update_rc_axes(self):
+        """
+        Map smoothed velocities to the RC range [-100, 100]. Done once per prediction
+        rather than on every RC tick, since the velocities only change here.
+        """
+        pitch = int(self.smoothed_forward_velocity * self.max_forward_speed)
+        yaw = int(self.smoothed_rotation_velocity * self.max_rotation_speed)
+        
+        # Clamp values to ensure they are within the accepted range
+        self.rc_pitch = -100 if pitch < -100 else (100 if pitch > 100 else pitch)
+        self.rc_yaw = -100 if yaw < -100 else (100 if yaw > 100 else yaw)
     
+    @staticmethod
+    def _make_scale_fn(exponent: float):
+        """Return x -> x ** exponent, specialized for common exponents to avoid pow()."""
+        if exponent == 1.0: return lambda x: x
+        if exponent == 1.5: return lambda x: x * math.sqrt(x)
+        if exponent == 2.0: return lambda x: x * x
+        if exponent == 3.0: return lambda x: x * x * x
+        return lambda x: x ** exponent
+
     def _apply_dead_zone_and_scaling(self, value: float) -> float:
         """Apply dead zone and non-linear scaling to a control value."""
-        if abs(value) < self.dead_zone: return 0.0
-        sign = np.sign(value)
-        scaled_val = (abs(value) - self.dead_zone) / (1.0 - self.dead_zone)
-        return sign * (scaled_val ** self.scale_exponent)
+        over = abs(value) - self.dead_zone
+        over = (over + abs(over)) * 0.5  # max(over, 0) without a branch
+        return math.copysign(self._scale(over * self._inv_live_range), value)
 
-    def _smooth(self, old_value, new_value):
-        """Helper for exponential moving average."""
-        return (self.smoothing_factor * old_value) + (1 - self.smoothing_factor) * new_value
+    def _smooth(self, value, trend, measurement):
+        """
+        One α-β filter step with dt = one prediction; returns (value, trend).
+        With smoothing_beta = 0 this is the plain exponential moving average.
+        """
+        predicted = value + trend
+        residual = measurement - predicted
+        return predicted + self._alpha * residual, trend + self.smoothing_beta * residual
 
     def get_rc_command(self) -> str:
         """
@@ -138,27 +216,26 @@ class TriadicController:
         This now uses the correct format for Tello.
         """
         if not self.enabled: return "rc 0 0 0 0"
-        
-        # Map velocities to drone command range [-100, 100]
-        # Roll (a), Pitch (b), Throttle (c), Yaw (d)
-        roll = 0
-        pitch = int(self.smoothed_forward_velocity * self.max_forward_speed)
-        throttle = 0
-        yaw = int(self.smoothed_rotation_velocity * self.max_rotation_speed)
-        
-        # Clamp values to ensure they are within the accepted range
-        pitch = np.clip(pitch, -100, 100)
-        yaw = np.clip(yaw, -100, 100)
-        
         # CRITICAL FIX: The RC command format is (roll, pitch, throttle, yaw).
         # We place the rotation value (yaw) in the 4th position.
-        return "rc {} {} {} {}".format(roll, pitch, throttle, yaw)
+        return "rc {} {} {} {}".format(0, self.rc_pitch, 0, self.rc_yaw)
+    
+    def get_rc_axes(self) -> Tuple[int, int, int, int]:
+        """Get the current RC command as (roll, pitch, throttle, yaw) integers."""
+        if not self.enabled: return (0, 0, 0, 0)
+        return (0, self.rc_pitch, 0, self.rc_yaw)
     
     def reset(self):
         """Reset controller state to zero out all velocities and buffers."""
         for buffer in self.prob_buffers.values(): buffer.clear()
+        for class_name in self.prob_buffers:
+            self.prob_sums[class_name] = 0.0
+            self.prob_sq_sums[class_name] = 0.0
         for spike_list in self.active_spikes.values(): spike_list.clear()
         self.smoothed_rotation_velocity = 0.0
         self.smoothed_forward_velocity = 0.0
+        self.rotation_trend = 0.0
+        self.forward_trend = 0.0
+        self._update_rc_axes()
         logger.info("TriadicController has been reset.")
 